@@ -92,7 +92,7 @@ setup(
     package_data={},
     py_modules=[splitext(basename(path))[0] for path in glob("src/*.py")],
     include_package_data=True,
-    install_requires=["docopt", "more-itertools", "schema", "setuptools >= 24.2.0"],
+    install_requires=["docopt", "schema", "setuptools >= 24.2.0"],
     extras_require={
         "test": [
             "coverage",
@@ -25,96 +25,111 @@ Options:
 """
 
 # Standard Python Libraries
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import hashlib
 import logging
 from pathlib import Path
+import shutil
 import sys
-
-# Third-Party Libraries
-import docopt
-from more_itertools import peekable
-from schema import And, Schema, SchemaError, Use
+from types import MappingProxyType
 
 from . import handlers
 from ._version import __version__
 
-MAGIC_START = "#!profile-sync "
-MAGIC_STOP = "#!profile-sync-stop"
+MAGIC_PREFIX = "#!profile-sync"
+MAGIC_START = MAGIC_PREFIX + " "
+MAGIC_STOP = MAGIC_PREFIX + "-stop"
+# The stop marker as it is written after each expanded magic block
+MAGIC_STOP_BLOCK = "\n" + MAGIC_STOP + "\n"
 PROFILE_START = "["
 SYNC_PATH = "sync"
+ENCODING = "utf-8"
+FETCH_WORKERS = 8
 
 
-def generate_profile(line_gen, config_overrides, missing_override_level=logging.ERROR):
-    """Generate a profile block with applied overrides.
+def apply_override(line, config_overrides, missing_override_level=logging.ERROR):
+    """Apply configuration overrides to a single line of a profile.
 
     Args:
-        line_gen: A peekable generator that will yield lines of a single profile.
-            The first line yielded must be the profile header in the form: [name]
-            line_gen will be read until a new profile header is peeked or the end of
-            file.
+        line: A line read from within a profile.
         config_overrides: A dictonary mapping configuration names to their values.
-            Any matching configuration names read from the line_gen will be overriden
-            with the assocated value from this dictionary.  Only overrides that match
-            will be yielded by the generator.
+            If the line is a configuration with a matching name its value will be
+            overriden with the assocated value from this dictionary.
 
-    Yields:
-        Modified lines read from line_gen.
+    Returns:
+        The line with any override applied.  Comments and whitespace are returned
+        unchanged.
+
+    Raises:
+        ValueError: If the line is an empty configuration without an override and
+            missing_override_level is logging.ERROR or higher.
 
     """
-    try:
-        # The first line is the profile name in brackets
-        yield next(line_gen)
-        # Read until the next profile start or EOF
-        while not line_gen.peek().startswith(PROFILE_START):
-            line = next(line_gen)
-            # Output configurations after applying overrides
-            if "=" in line:
-                key, value = line.split("=", 1)
-                key = key.strip()
-                value = value.strip()
-                if not value and key not in config_overrides:
-                    logging.log(
-                        missing_override_level,
-                        f"No override provided for an empty external configuration line: {key}",
-                    )
-                    if missing_override_level >= logging.ERROR:
-                        raise ValueError(f"Missing override: {key}")
-                yield f"{key} = {config_overrides.get(key, value)}"
-            else:
-                # Comment or whitespace pass through
-                yield line
-
-    except StopIteration:
-        pass
-    return
+    key, sep, value = line.partition("=")
+    if not sep:
+        # Comment or whitespace pass through
+        return line
+    key = key.strip()
+    value = value.strip()
+    if not value and key not in config_overrides:
+        logging.log(
+            missing_override_level,
+            "No override provided for an empty external configuration line: %s",
+            key,
+        )
+        if missing_override_level >= logging.ERROR:
+            raise ValueError(f"Missing override: {key}")
+    return f"{key} = {config_overrides.get(key, value)}\n"
 
 
 def read_external(line_gen, config_overrides, missing_override_level=logging.ERROR):
     """Read an external source for profiles and apply configuration overrides.
 
     Args:
-        line_gen: A peekable generator that will yield lines of one or more profiles.
+        line_gen: An iterator that will yield newline terminated lines of one or more
+            profiles.
         config_overrides: A dictonary mapping configuration names to their values.
 
     Yields:
         Modified lines read from line_gen.
 
     """
-    try:
-        while True:
-            if line_gen.peek().startswith(PROFILE_START):
-                yield from generate_profile(
-                    line_gen,
-                    config_overrides,
-                    missing_override_level=missing_override_level,
-                )
-            else:
-                yield next(line_gen)
-    except StopIteration:
-        pass
-    return
+    # Overrides only apply to lines that follow the first profile header
+    in_profile = False
+    for line in line_gen:
+        if line.startswith(PROFILE_START):
+            in_profile = True
+            yield line
+        elif in_profile:
+            yield apply_override(line, config_overrides, missing_override_level)
+        else:
+            yield line
+
+
+def parse_terms(terms):
+    """Parse a sequence of key=value terms into a dictionary.
+
+    Args:
+        terms: An iterable of strings in the form: key=value
+
+    Returns:
+        A dictionary mapping each key to its value.
 
+    Raises:
+        ValueError: If a term does not contain an "=".
 
+    """
+    result = {}
+    for term in terms:
+        key, sep, value = term.partition("=")
+        if not sep:
+            raise ValueError(f"Expected a key=value term: {term}")
+        result[key] = value
+    return result
+
+
+@functools.lru_cache(maxsize=128)
 def parse_magic(line):
     """Parse a magic config line and return the associated parameters.
 
@@ -128,28 +143,19 @@ def parse_magic(line):
 
     Returns:
         A tuple containing the URL, handler parameter dictonary, and a configuration
-        overrides dictionary.
+        overrides dictionary.  Results are cached, so the dictionaries are returned
+        as read-only mappings.
 
     """
-    logging.debug(f"Parsing magic: {line}")
-    if "--" in line:
-        # Split the line into handler and override sections
-        handler_line, overrides_line = line.split("--")
-    else:
-        handler_line = line
-        overrides_line = ""
-    # Split the line into terms
-    handler_terms = handler_line.split()
-    # Discard the magic
-    handler_terms.pop(0)
-    url = handler_terms.pop(0)
-    # Remaining handler_terms are params to the handler
-    handler_params = dict(map(lambda x: x.split("="), handler_terms))
+    logging.debug("Parsing magic: %s", line)
+    # Split the line into handler and override sections
+    handler_line, _, overrides_line = line.partition("--")
+    # Discard the magic, remaining terms are the URL and params to the handler
+    _, url, *handler_terms = handler_line.split()
+    handler_params = MappingProxyType(parse_terms(handler_terms))
 
     # Process override line
-    override_terms = overrides_line.split()
-    # Split remaining terms into key value pairs
-    config_overrides = dict(map(lambda x: x.split("="), override_terms))
+    config_overrides = MappingProxyType(parse_terms(overrides_line.split()))
 
     return url, handler_params, config_overrides
 
@@ -167,17 +173,58 @@ def handle_magic(magic_line, work_path, missing_override_level=logging.ERROR):
 
     """
     url, handler_params, config_overrides = parse_magic(magic_line)
-    logging.debug(f"Processing remote: {url}")
+    logging.debug("Processing remote: %s", url)
     clazz = handlers.find_handler(url)
     if not clazz:
         raise ValueError(f"Could not find a handler that can fetch: {url}")
-    logging.debug(f"Using {clazz} to fetch external data.")
+    logging.debug("Using %s to fetch external data.", clazz)
     # Instanciate the handler
     handler = clazz(work_path)
-    external_profile_gen = peekable(handler.fetch(url, **handler_params))
+    external_profile_gen = handler.fetch(url, **handler_params)
     return read_external(external_profile_gen, config_overrides, missing_override_level)
 
 
+def fetch_externals(magic_lines, work_path, missing_override_level=logging.ERROR):
+    """Fetch the external resources referenced by magic lines concurrently.
+
+    Magic lines whose handlers share working state, such as a clone directory, are
+    handled one after another by the same worker.  Everything else is fetched in
+    parallel.
+
+    Args:
+        magic_lines: An iterable of magic strings to handle.
+        work_path: A directory where the handlers can store state.
+
+    Returns:
+        A dictionary mapping each magic line to a list of the lines generated from
+        the external resource it references.
+
+    """
+    # Group the distinct magic lines by the handler state they will use
+    lines_by_state = {}
+    for magic_line in dict.fromkeys(magic_lines):
+        url = parse_magic(magic_line)[0]
+        clazz = handlers.find_handler(url)
+        # Lines without a handler fail in handle_magic, so group them by URL
+        key = (clazz, clazz.state_key(url) if clazz else url)
+        lines_by_state.setdefault(key, []).append(magic_line)
+
+    def fetch_group(group_magic_lines):
+        return [
+            (
+                magic_line,
+                list(handle_magic(magic_line, work_path, missing_override_level)),
+            )
+            for magic_line in group_magic_lines
+        ]
+
+    externals = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        for results in executor.map(fetch_group, lines_by_state.values()):
+            externals.update(results)
+    return externals
+
+
 def generate_credentials_file(credentials_file, missing_override_level=logging.ERROR):
     """Generate lines for a credentials file by expanding external references.
 
@@ -188,27 +235,28 @@ def generate_credentials_file(credentials_file, missing_override_level=logging.E
         A generator that will return updated lines based on the input credentials file.
 
     """
-    logging.info(f"Reading credentials file located at: {credentials_file}")
+    logging.info("Reading credentials file located at: %s", credentials_file)
     in_magic_block = False
     work_path = credentials_file.parent / SYNC_PATH
-    line_gen = (line for line in open(credentials_file))
-    while True:
-        try:
-            line = next(line_gen)
-        except StopIteration:
-            break
-        if line.startswith(MAGIC_START):
-            yield line + "\n"
-            for external_line in handle_magic(line, work_path, missing_override_level):
-                yield external_line
-                if not external_line.endswith("\n"):
-                    yield "\n"
-            yield "\n" + MAGIC_STOP + "\n"
-            in_magic_block = True
-            continue
-        if line.startswith(MAGIC_STOP):
-            in_magic_block = False
-            continue
+    lines = credentials_file.read_text(encoding=ENCODING).splitlines(keepends=True)
+    # Fetch all of the external resources before generating any output
+    externals = fetch_externals(
+        (line for line in lines if line.startswith(MAGIC_START)),
+        work_path,
+        missing_override_level,
+    )
+    for line in lines:
+        # Most lines are not magic so check the shared prefix first
+        if line.startswith(MAGIC_PREFIX):
+            if line.startswith(MAGIC_START):
+                yield line + "\n"
+                yield from externals[line]
+                yield MAGIC_STOP_BLOCK
+                in_magic_block = True
+                continue
+            if line.startswith(MAGIC_STOP):
+                in_magic_block = False
+                continue
         if not in_magic_block:
             yield line
 
@@ -233,6 +281,12 @@ def files_identical(path1, path2):
 
 def main() -> None:
     """Set up logging and generate a new credentials file."""
+    # These are only needed to handle the command line, so they are imported here
+    # to keep them off the import path of the library functions.
+    # Third-Party Libraries
+    import docopt
+    from schema import And, Schema, SchemaError, Use
+
     args = docopt.docopt(__doc__, version=__version__)
     # Validate and convert arguments as needed
     schema = Schema(
@@ -271,18 +325,20 @@ def main() -> None:
     if dry_run:
         # The user requested a dry-run.  Just output the new file to stdout
         logging.info("Dry run.  Outputting credentials file to standard out:")
-        for line in generate_credentials_file(credentials_file, missing_override_level):
-            sys.stdout.write(line)
+        sys.stdout.writelines(
+            generate_credentials_file(credentials_file, missing_override_level)
+        )
     else:
         # Carefully craft a new credentials file on disk.
         temp_file = credentials_file.with_suffix(".temp")
         backup_file = credentials_file.with_suffix(".backup")
-        logging.info(f"Writing new credentials file to: {temp_file}")
-        with open(temp_file, "w") as out:
-            for line in generate_credentials_file(
-                credentials_file, missing_override_level
-            ):
-                out.write(line)
+        logging.info("Writing new credentials file to: %s", temp_file)
+        with open(temp_file, "w", encoding=ENCODING) as out:
+            out.write(
+                "".join(
+                    generate_credentials_file(credentials_file, missing_override_level)
+                )
+            )
 
         # Check to see if the new files differs from the original.
         if files_identical(temp_file, credentials_file):
@@ -290,10 +346,12 @@ def main() -> None:
             logging.info("No changes applied.")
             temp_file.unlink()
         else:
-            # If everything has succeeded we swap in the new file and backup the original
-            logging.info(f"Backing up previous credentials file to: {backup_file}")
-            credentials_file.replace(backup_file)
-            logging.info(f"Installing new credentials file to: {credentials_file}")
+            # If everything has succeeded we backup the original and swap in the new
+            # file.  The original is copied rather than moved so that the swap is a
+            # single atomic rename and a credentials file is always present.
+            logging.info("Backing up previous credentials file to: %s", backup_file)
+            shutil.copy2(credentials_file, backup_file)
+            logging.info("Installing new credentials file to: %s", credentials_file)
             temp_file.replace(credentials_file)
 
     # Stop logging and clean up
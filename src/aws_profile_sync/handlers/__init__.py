@@ -1,9 +1,16 @@
 """This module contains handlers for the various supported URLs."""
+# Standard Python Libraries
+import functools
+
 from .ssh_git import SSHGitHandler
 
 __all__ = ["SSHGitHandler"]
 
+# The handler classes to search, in the order they are listed in __all__
+_HANDLERS = tuple(globals()[handler] for handler in __all__)
+
 
+@functools.lru_cache(maxsize=128)
 def find_handler(url):
     """Find a handler that will support a URL.
 
@@ -14,10 +21,8 @@ def find_handler(url):
         If a handler is found a class will be returned, None otherwise.
 
     """
-    for handler in __all__:
-        # Get the symbol for handler
-        mod = globals()[handler]
+    for handler in _HANDLERS:
         # Ask handler if it can handle the url
-        if getattr(mod, "can_handle")(url):
-            return mod
+        if handler.can_handle(url):
+            return handler
     return None
@@ -2,9 +2,19 @@
 
 # Standard Python Libraries
 import logging
+import os
 from pathlib import Path
+import re
+import shutil
 import subprocess  # nosec: Security of subprocess has been considered
 
+# Resolve git once and never let it stop to prompt for input
+GIT = shutil.which("git") or "git"
+GIT_ENV_OVERRIDES = {"GIT_OPTIONAL_LOCKS": "0", "GIT_TERMINAL_PROMPT": "0"}
+
+# Matches URLs of the form: ssh://host/path/repo.git
+SSH_GIT_URL_RE = re.compile(r"\Assh://.+\.git\Z")
+
 
 class SSHGitHandler:
     """A Git repository over secure shell handler.
@@ -26,7 +36,22 @@ class SSHGitHandler:
             True if the URL can be handled.  False otherwise.
 
         """
-        return url.startswith("ssh://") and url.endswith(".git")
+        return SSH_GIT_URL_RE.match(url) is not None
+
+    @staticmethod
+    def state_key(url):
+        """Identify the working state used to fetch a specified URL.
+
+        URLs that share a key must not be fetched at the same time.
+
+        Args:
+            url: A URL that this class can handle.
+
+        Returns:
+            The name of the directory the URL's repository is cloned into.
+
+        """
+        return url.split("/")[-1].split(".")[0]
 
     def __init__(self, work_path):
         """Instanciate a new SSHGitHandler.
@@ -50,29 +75,46 @@ class SSHGitHandler:
             repo_file: The file to read from the repository.
 
         Yields:
-            Lines read from the specified repository file.
+            Newline terminated lines read from the specified repository file.
 
         Raises:
             subprocess.CalledProcessError: If a subprocess returns a non-zero exit code.
 
         """
-        repo_name = url.split("/")[-1].split(".")[0]
-        repo_path = self.work_path / repo_name
+        repo_path = self.work_path / SSHGitHandler.state_key(url)
+        # Build the environment now so any changes made since import reach git
+        git_env = {**os.environ, **GIT_ENV_OVERRIDES}
         read_file = repo_path / filename
 
+        # Only the tip of the requested branch is needed, so avoid transferring any
+        # history and reset to whatever was fetched.
         if repo_path.exists():
-            logging.info(f"Pulling {url}")
-            subprocess.run(["git", "pull"], check=True, cwd=repo_path)  # nosec
+            logging.info("Updating %s", url)
+            subprocess.run(  # nosec
+                [GIT, "fetch", "--depth=1", "origin", branch],
+                check=True,
+                cwd=repo_path,
+                env=git_env,
+            )
+            subprocess.run(  # nosec
+                [GIT, "reset", "--hard", "FETCH_HEAD"],
+                check=True,
+                cwd=repo_path,
+                env=git_env,
+            )
         else:
-            logging.info(f"Cloning {url}")
+            logging.info("Cloning %s", url)
             subprocess.run(  # nosec
-                ["git", "clone", url], check=True, cwd=self.work_path
+                [GIT, "clone", "--depth=1", "--single-branch", "--branch", branch, url],
+                check=True,
+                cwd=self.work_path,
+                env=git_env,
             )
-        # Switch to the requested branch
-        logging.debug(f"Switching to branch {branch}")
-        subprocess.run(["git", "switch", branch], check=True, cwd=repo_path)  # nosec
 
-        logging.debug(f"Reading from repo: {read_file}")
-        with read_file.open() as f:
-            yield from f
+        logging.debug("Reading from repo: %s", read_file)
+        text = read_file.read_text(encoding="utf-8")
+        # Consumers expect every line to be newline terminated
+        if text and not text.endswith("\n"):
+            text += "\n"
+        yield from text.splitlines(keepends=True)
         return
@@ -4,7 +4,10 @@
 # Standard Python Libraries
 import logging
 import os
+import subprocess  # nosec
 import sys
+import threading
+import time
 from unittest.mock import patch
 
 # Third-Party Libraries
@@ -21,6 +24,8 @@ log_levels = (
     "critical",
 )
 
+GIT = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+
 # define sources of version strings
 RELEASE_TAG = os.getenv("RELEASE_TAG")
 PROJECT_VERSION = aws_profile_sync.__version__
@@ -103,3 +108,288 @@ def test_bad_log_level():
         except SystemExit as sys_exit:
             return_code = sys_exit.code
         assert return_code == 1, "main() should return failure"
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("ssh://git@example.com/org/repo.git", aws_profile_sync.handlers.SSHGitHandler),
+        ("https://example.com/org/repo.git", None),
+        ("ssh://git@example.com/org/repo", None),
+    ],
+)
+def test_find_handler(url, expected):
+    """Verify that URLs are routed to the correct handler."""
+    assert (
+        aws_profile_sync.handlers.find_handler(url) is expected
+    ), f"find_handler should return {expected} for {url}"
+
+
+def test_dry_run(capsys):
+    """Verify that a dry run writes the credentials file to stdout."""
+    with patch.object(
+        sys,
+        "argv",
+        ["bogus", "--dry-run", "--credentials-file=tests/credentials-test"],
+    ):
+        aws_profile_sync.aws_profile_sync.main()
+    captured = capsys.readouterr()
+    with open("tests/credentials-test") as f:
+        assert (
+            captured.out == f.read()
+        ), "dry run output should match the unmodified credentials file"
+
+
+def test_install_new_credentials_file(tmp_path):
+    """Verify that a changed credentials file is installed and backed up."""
+    credentials_file = tmp_path / "credentials"
+    profile = "[test-user]\naws_access_key_id = XXXXXXXXXXXXXXXXXXXX\n"
+    # A stray stop marker is dropped from the output, which changes the file
+    original = profile + "#!profile-sync-stop\n"
+    credentials_file.write_text(original)
+    with patch.object(sys, "argv", ["bogus", f"--credentials-file={credentials_file}"]):
+        aws_profile_sync.aws_profile_sync.main()
+    assert (
+        credentials_file.with_suffix(".backup").read_text() == original
+    ), "the original credentials file should be backed up"
+    assert (
+        credentials_file.read_text() == profile
+    ), "the new credentials file should be installed"
+    assert not credentials_file.with_suffix(
+        ".temp"
+    ).exists(), "the temporary file should be removed"
+
+
+@pytest.fixture
+def git_remote(tmp_path):
+    """Create a Git repository with a roles file on two branches."""
+    source = tmp_path / "source"
+    subprocess.run(GIT + ["init", "-q", "-b", "master", str(source)], check=True)
+    (source / "roles").write_text("[master-role]\nregion = us-east-1\n")
+    subprocess.run(GIT + ["-C", str(source), "add", "roles"], check=True)
+    subprocess.run(GIT + ["-C", str(source), "commit", "-qm", "master"], check=True)
+    subprocess.run(GIT + ["-C", str(source), "switch", "-qc", "develop"], check=True)
+    (source / "roles").write_text("[develop-role]\nregion = us-west-2")
+    subprocess.run(GIT + ["-C", str(source), "commit", "-qam", "develop"], check=True)
+    subprocess.run(GIT + ["-C", str(source), "switch", "-q", "master"], check=True)
+    return f"file://{source}"
+
+
+@pytest.mark.parametrize(
+    "branch,expected",
+    [
+        ("master", ["[master-role]\n", "region = us-east-1\n"]),
+        ("develop", ["[develop-role]\n", "region = us-west-2\n"]),
+    ],
+)
+def test_ssh_git_fetch(tmp_path, git_remote, branch, expected):
+    """Verify that the SSH Git handler clones, updates, and reads a repository."""
+    handler = aws_profile_sync.handlers.SSHGitHandler(tmp_path / "work")
+    for _ in range(2):
+        # The first fetch clones the repository and the second updates it
+        assert (
+            list(handler.fetch(git_remote, branch=branch)) == expected
+        ), f"fetch should yield the roles file from the {branch} branch"
+
+
+def test_generate_credentials_file(tmp_path):
+    """Verify that magic blocks are replaced with external profiles."""
+    credentials_file = tmp_path / "credentials"
+    magic = "#!profile-sync ssh://git@example.com/org/repo.git branch=develop"
+    credentials_file.write_text(
+        "[local]\n"
+        "key = a\n"
+        f"{magic} -- role_arn=arn\n"
+        "[stale]\n"
+        "#!profile-sync-stop\n"
+        "[after]\n"
+    )
+    with patch.object(
+        aws_profile_sync.handlers.SSHGitHandler,
+        "fetch",
+        return_value=iter(["[remote]\n", "role_arn =\n", "region = us-east-1\n"]),
+    ) as fetch:
+        lines = list(
+            aws_profile_sync.aws_profile_sync.generate_credentials_file(
+                credentials_file
+            )
+        )
+    fetch.assert_called_once_with(
+        "ssh://git@example.com/org/repo.git", branch="develop"
+    )
+    assert "".join(lines) == (
+        "[local]\n"
+        "key = a\n"
+        f"{magic} -- role_arn=arn\n"
+        "\n"
+        "[remote]\n"
+        "role_arn = arn\n"
+        "region = us-east-1\n"
+        "\n"
+        "#!profile-sync-stop\n"
+        "[after]\n"
+    ), "magic block should be replaced with the external profiles"
+
+
+@pytest.mark.parametrize(
+    "line,expected",
+    [
+        (
+            "#!profile-sync ssh://git@example.com/org/repo.git\n",
+            ("ssh://git@example.com/org/repo.git", {}, {}),
+        ),
+        (
+            "#!profile-sync ssh://git@example.com/org/repo.git branch=develop "
+            "filename=roles -- role_session_name=me source_profile=a=b\n",
+            (
+                "ssh://git@example.com/org/repo.git",
+                {"branch": "develop", "filename": "roles"},
+                {"role_session_name": "me", "source_profile": "a=b"},
+            ),
+        ),
+    ],
+)
+def test_parse_magic(line, expected):
+    """Verify that magic lines are parsed into a URL, params, and overrides."""
+    assert (
+        aws_profile_sync.aws_profile_sync.parse_magic(line) == expected
+    ), "parse_magic should return the URL, handler params, and overrides"
+
+
+def test_parse_magic_bad_term():
+    """Verify that a term without a value is rejected."""
+    with pytest.raises(ValueError):
+        aws_profile_sync.aws_profile_sync.parse_magic(
+            "#!profile-sync ssh://git@example.com/org/repo.git develop\n"
+        )
+
+
+def test_read_external():
+    """Verify that overrides are applied to every external profile."""
+    lines = iter(
+        [
+            "# comment\n",
+            "[one]\n",
+            "region = us-east-1\n",
+            "role_session_name =\n",
+            "\n",
+            "[two]\n",
+            "role_session_name =\n",
+        ]
+    )
+    assert list(
+        aws_profile_sync.aws_profile_sync.read_external(
+            lines, {"role_session_name": "me"}
+        )
+    ) == [
+        "# comment\n",
+        "[one]\n",
+        "region = us-east-1\n",
+        "role_session_name = me\n",
+        "\n",
+        "[two]\n",
+        "role_session_name = me\n",
+    ], "overrides should be applied to each profile"
+
+
+def test_read_external_missing_override():
+    """Verify that an empty configuration without an override is an error."""
+    with pytest.raises(ValueError):
+        list(
+            aws_profile_sync.aws_profile_sync.read_external(
+                iter(["[one]\n", "role_session_name =\n"]), {}
+            )
+        )
+
+
+def test_generate_credentials_file_multiple_remotes(tmp_path):
+    """Verify that each magic block is replaced with its own external profiles."""
+    credentials_file = tmp_path / "credentials"
+    magic_one = "#!profile-sync ssh://git@example.com/org/one.git\n"
+    magic_two = "#!profile-sync ssh://git@example.com/org/two.git\n"
+    credentials_file.write_text(magic_one + magic_two + magic_one)
+    with patch.object(
+        aws_profile_sync.handlers.SSHGitHandler,
+        "fetch",
+        side_effect=lambda url: iter([f"[{url.split('/')[-1]}]\n"]),
+    ) as fetch:
+        output = "".join(
+            aws_profile_sync.aws_profile_sync.generate_credentials_file(
+                credentials_file
+            )
+        )
+    assert fetch.call_count == 2, "each distinct magic line should be fetched once"
+    stop = "\n#!profile-sync-stop\n"
+    assert output == (
+        f"{magic_one}\n[one.git]\n{stop}"
+        f"{magic_two}\n[two.git]\n{stop}"
+        f"{magic_one}\n[one.git]\n{stop}"
+    ), "each magic block should contain the profiles from its remote"
+
+
+def test_ssh_git_fetch_change_branch(tmp_path, git_remote):
+    """Verify that an existing clone can be updated to a different branch."""
+    handler = aws_profile_sync.handlers.SSHGitHandler(tmp_path / "work")
+    list(handler.fetch(git_remote, branch="master"))
+    assert list(handler.fetch(git_remote, branch="develop")) == [
+        "[develop-role]\n",
+        "region = us-west-2\n",
+    ], "fetch should yield the roles file from the newly requested branch"
+
+
+def test_parse_magic_cached():
+    """Verify that cached parse_magic results cannot be modified by callers."""
+    line = "#!profile-sync ssh://git@example.com/org/repo.git -- region=us-east-1\n"
+    parse_magic = aws_profile_sync.aws_profile_sync.parse_magic
+    assert parse_magic(line) is parse_magic(line), "results should be cached"
+    with pytest.raises(TypeError):
+        parse_magic(line)[2]["region"] = "us-west-2"
+
+
+def test_fetch_externals_shared_clone(tmp_path):
+    """Verify that URLs sharing a clone directory are not fetched concurrently."""
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    def fetch(url):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return iter([f"# {url}\n"])
+
+    magic_lines = [
+        "#!profile-sync ssh://git@example.com/org-a/roles.git\n",
+        "#!profile-sync ssh://git@example.com/org-b/roles.git\n",
+    ]
+    with patch.object(
+        aws_profile_sync.handlers.SSHGitHandler, "fetch", side_effect=fetch
+    ):
+        externals = aws_profile_sync.aws_profile_sync.fetch_externals(
+            magic_lines, tmp_path
+        )
+    assert active["max"] == 1, "URLs sharing a clone should be fetched in order"
+    assert externals == {
+        magic_lines[0]: ["# ssh://git@example.com/org-a/roles.git\n"],
+        magic_lines[1]: ["# ssh://git@example.com/org-b/roles.git\n"],
+    }, "each magic line should map to its own external lines"
+
+
+def test_ssh_git_fetch_environment(tmp_path):
+    """Verify that git sees environment changes made after import."""
+    handler = aws_profile_sync.handlers.SSHGitHandler(tmp_path / "work")
+    with patch.dict(os.environ, {"GIT_SSH_COMMAND": "ssh -i key"}):
+        with patch.object(
+            aws_profile_sync.handlers.ssh_git.subprocess,
+            "run",
+            side_effect=subprocess.CalledProcessError(1, "git"),
+        ) as run:
+            with pytest.raises(subprocess.CalledProcessError):
+                list(handler.fetch("ssh://git@example.com/org/repo.git"))
+    env = run.call_args.kwargs["env"]
+    assert (
+        env["GIT_SSH_COMMAND"] == "ssh -i key"
+    ), "git should see the current environment"
+    assert env["GIT_TERMINAL_PROMPT"] == "0", "git should never prompt for input"